@@ -0,0 +1,18 @@
+'''
+Optional build of solver_inp_to_xml.py as a compiled extension module with mypyc.
+solver_inp_to_xml.py runs as plain python by default. it uses the compiled module when the environment variable
+SVFSI_INP_TO_XML_COMPILED is set and the module is found next to the script and is newer than it.
+
+------ USAGE ------
+pip install mypy setuptools
+python setup.py build_ext --inplace
+SVFSI_INP_TO_XML_COMPILED=1 python solver_inp_to_xml.py path/to/solver.inp path/to/svFSI.xml
+'''
+
+from setuptools import setup
+from mypyc.build import mypycify
+
+setup(
+    name='solver_inp_to_xml',
+    ext_modules=mypycify(['--ignore-missing-imports', 'solver_inp_to_xml.py']),
+)
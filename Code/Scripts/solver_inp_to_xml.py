@@ -1,4 +1,9 @@
+import glob
+import importlib
+import os
 import sys
+from multiprocessing import Pool
+from typing import Callable
 
 '''
 Script to perform a direct conversion from a solver.inp to svFSI.xml file
@@ -10,11 +15,74 @@ Date: 2024-08-08
     in the xml files I have seen, they are true/false. For this conversion, all booleans have been set to 0/1, for consistency.
 - there are some differences in the solvers/preconditioners between the INP and XML files. please ensure these are correct.
 - some parameters may take different values in svFSI and svFSIplus, please ensure these are correct.
+- this script can optionally be compiled with mypyc for faster conversions, see setup.py. the compiled module is used when
+    the environment variable SVFSI_INP_TO_XML_COMPILED is set and it is newer than this script.
 
 ------ USAGE ------
 python solver_inp_to_xml.py path/to/solver.inp path/to/svFSI.xml
+
+batch conversion in parallel, each xml file is written next to its inp file with an .xml extension.
+existing xml files are skipped unless --force is given.
+python solver_inp_to_xml.py --batch [--force] path/to/dir 'path/to/sweep_*/solver.inp'
 '''
 
+# map of values in the inp file to their xml values, bools become 1/0
+_VALUE_XFORM = {'true': '1', 't': '1', 'false': '0', 'f': '0'}
+
+# map of keys in the inp file which are renamed in the xml file
+_KEY_RENAME = {'LS type': 'LS'}
+
+# map of keys to attributes for certain xml tags
+_KEY_TO_ATTR = {
+    'svFSIFile': 'version',
+    'Add_face': 'name',
+    'Add_mesh': 'name',
+    'Add_projection': 'name',
+    'Add_equation': 'type',
+    'Domain': 'id',
+    'Viscosity': 'model',
+    'Constitutive_model': 'type',
+    'LS': 'type',
+    'Linear_algebra': 'type',
+    'Output': 'type',
+    'Add_BC': 'name',
+}
+
+# cache of indentation strings, indexed by the number of tabs
+_INDENT_CACHE = ['']
+
+def _indent(n: int) -> str:
+    '''
+    get the indentation string of n tabs, growing the cache as needed
+
+    :param n: number of tabs, no indentation if n < 1
+    '''
+
+    if n < 1:
+        return ''
+
+    while len(_INDENT_CACHE) <= n:
+        _INDENT_CACHE.append('\t' * len(_INDENT_CACHE))
+
+    return _INDENT_CACHE[n]
+
+
+def _partition(text: str, line: str = '') -> 'tuple[str, str]':
+    '''
+    split a line, or a part of a line, of the inp file into key and value
+
+    :param text: stripped line of the inp file, or the part of it to split
+    :param line: the full line for error messages, if text is only a part of it
+    :return: the key and value around the first ': '
+    '''
+
+    key, sep, value = text.partition(': ')
+    if not sep:
+        raise ValueError(f'could not parse solver.inp line: {line or text}')
+
+    return key, value
+
+
 class SolverInpConverter():
     '''class to convert a solver.inp file to an svFSI.xml file'''
 
@@ -28,7 +96,6 @@ class SolverInpConverter():
         self.inp_file = inp_file
         self.xml_file = xml_file
         self.data_root = None
-        self.lines = []
         self.parsed_data = {}
 
 
@@ -40,33 +107,102 @@ class SolverInpConverter():
         # initialize the root of the data tree
         self.data_root = DataNode(key='svFSIFile', value='0.1', is_root=True)
 
-        with open(self.inp_file, 'r') as f:
-            self.lines = f.readlines()
-
         # parse the data and create data tree
-        self.data_root.parse(self.lines)
+        self.parse_lines()
+
+
+    def parse_lines(self):
+        '''
+        Create the data tree from the lines of the inp file in a single pass.
+        '''
+
+        # stack of the currently open nodes
+        stack = [self.data_root]
+        for line in self.read_lines():
+            # remove whitespace from the line
+            line = line.strip()
+
+            if line.startswith('#') or len(line) == 0:
+                # skip comments and blank lines
+                continue
+
+            if line.endswith('{'):
+                # multiline nested data
+                key, value = _partition(line)
+                # the value ends before the last space, which precedes the brace
+                end = value.rfind(' ')
+                if end == -1:
+                    raise ValueError(f'could not parse solver.inp line: {line}')
+                value = value[:end]
+
+                # add data to tree and jump one level down
+                stack.append(stack[-1].add_child(key, value))
+
+            elif '{' in line:
+                # inline nested data
+                brace = line.find(' {')
+                if brace == -1:
+                    raise ValueError(f'could not parse solver.inp line: {line}')
+                # parse node
+                node_key, node_value = _partition(line[:brace], line)
+                # parse nested data
+                subnode_key, subnode_value = _partition(line[brace + 2:], line)
+                subnode_value = subnode_value.replace('}', '')
+
+                # add nodes to tree, we assume there is no further nesting
+                curr_node = stack[-1].add_child(node_key, node_value)
+                curr_node.add_child(subnode_key, subnode_value)
+
+            elif '}' in line:
+                # jump one level up in the tree
+                if len(stack) == 1:
+                    raise ValueError(f'unmatched closing brace in solver.inp line: {line}')
+                stack.pop()
+
+            else:
+                # no nesting, just add the data to children
+                key, value = _partition(line)
+                stack[-1].add_child(key, value)
+
+        if len(stack) != 1:
+            raise ValueError(f'nested data not closed at end of solver.inp file: {stack[-1].key} {stack[-1].value}')
+
+
+    def read_lines(self):
+        '''
+        Generator over the lines of the inp file.
+        '''
+
+        with open(self.inp_file, 'r') as f:
+            yield from f
 
 
     def convert_to_xml(self):
         '''
         Convert the parsed data to an xml file.
         '''
-        # format the data tree to xml
-        self.data_root.format_for_xml()
-
-        with open(self.xml_file, 'w') as f:
+        # write directly to the xml file through a large buffer
+        with open(self.xml_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
             # write the xml header
             f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
 
-            # write the formatted data tree to xml file
-            for line in self.data_root.xmllist:
-                f.write(line)
+            # format the data tree to xml and write it to the xml file
+            self.data_root.format_for_xml(f.write)
         
 
 class DataNode():
     '''
     Class to handle nested data from an inp file.
     '''
+
+    key: str
+    value: str
+    is_root: bool
+    level: int
+    root: 'DataNode'
+    parent: 'DataNode'
+    children: 'list[DataNode]'
+
     def __init__(self, key: str, value: str, level: int =0, is_root: bool=False, root=None):
         '''
         initialize the DataNode object
@@ -78,20 +214,12 @@ class DataNode():
         :param root: the root DataNode of the data tree
         '''
 
-        if key == 'LS type':
-            # corner case, LS_type becomes LS
-            self.key = 'LS'
-        else:
-            # add underscores for xml
-            self.key = key.replace(' ', '_')
+        # rename corner cases (e.g. LS_type becomes LS) and add underscores for xml
+        # keys recur throughout the file, interning them shares one string per key and speeds up lookups
+        self.key = sys.intern(_KEY_RENAME.get(key, key).replace(' ', '_'))
         
         # convert bools to 1/0
-        if value in ['true', 't']:
-            self.value = '1'
-        elif value in ['false', 'f']:
-            self.value = '0'
-        else:
-            self.value = value
+        self.value = _VALUE_XFORM.get(value, value)
         
         self.is_root = is_root
         self.level = level # level within the tree
@@ -99,118 +227,49 @@ class DataNode():
             self.root = self
         else:
             self.root = root
-        
-        self.lines_parsed = 0 # keep track of lines searched in the input file
+
         self.children = [] # list of children nodes
-        self.xmllist = [] # list of xml formatted data
-
-        # a map of keys to attributes for certain xml tags. 
-        self.key_to_attr = {
-            'svFSIFile': 'version',
-            'Add_face': 'name',
-            'Add_mesh': 'name',
-            'Add_projection': 'name',
-            'Add_equation': 'type',
-            'Domain': 'id',
-            'Viscosity': 'model',
-            'Constitutive_model': 'type',
-            'LS': 'type',
-            'Linear_algebra': 'type',
-            'Output': 'type',
-            'Add_BC': 'name',
-        }
-    
 
 
-    def parse(self, lines):
+    def add_child(self, key: str, value: str) -> 'DataNode':
         '''
-        parse the nested data from the inp file.
+        create a child node one level below this node and add it to the tree
 
-        :param lines: the remaining lines of the inp file
+        :param key: the key of the child data
+        :param value: the value of the child data
+        :return: the new child DataNode
         '''
-        for idx, line in enumerate(lines):
-            # remove whitespace from the line
-            line = line.strip()
-
-            if line.startswith('#') or len(line) == 0:
-                # update lines searched, but don't do parse teh data
-                self.lines_parsed += 1
-                continue
 
-            if idx >= self.lines_parsed:
-                # parse this line, it has not been read yet
-                self.update_lines_parsed() # update index of parsed lines
-                # print(line)
-                if '{' in line:
-                    # either we have multiline nested data or inline nested data
-                    if '{' in line[-1]: # multiline nested data
-                        # jump one level down and parse data
-                        key, value = line.split(': ', 1)
-                        value, _ = value.rsplit(' ')
-
-                        # add data to tree
-                        curr_node = DataNode(key, value, level = self.level + 1, root=self.root)
-                        curr_node.parent = self
-                        self.children.append(curr_node)
-
-                        # recursive step
-                        curr_node.parse(lines[idx+1:])
-
-                    else: # inline nested data
-                        # parse node
-                        node, subnode = line.split(' {')
-                        node_key, node_value = node.split(': ', 1)
-                        # parse nested data
-                        subnode_key, subnode_value = subnode.split(': ', 1)
-                        subnode_value = subnode_value.replace('}', '')
-
-                        # add nodes to tree, we assume there is no further nesting so we will not take the recursive step
-                        curr_node = DataNode(node_key, node_value, level = self.level + 1, root=self.root)
-                        curr_node.parent = self
-                        subnode = DataNode(subnode_key, subnode_value, level = self.level + 2, root=self.root)
-                        subnode.parent = curr_node
-                        curr_node.children.append(subnode)
-                        self.children.append(curr_node)
-
-                elif '}' in line:
-                    # jump one level up in the tree
-                    break
-
-                else:
-                    # no nesting, just add the data to children
-                    key, value = line.split(': ', 1)
-                    self.children.append(DataNode(key, value, level=self.level + 1, root=self.root))
-                
-            
-    def update_lines_parsed(self, update_parent=True):
-        '''
-        recursively update lines parsed
-        '''
+        child = DataNode(key, value, level=self.level + 1, root=self.root)
+        child.parent = self
+        self.children.append(child)
 
-        self.lines_parsed += 1
+        return child
 
-        if not self.is_root:
-            self.parent.update_lines_parsed() # parent is also updated
-    
 
-    def format_for_xml(self):
+    def format_for_xml(self, write: 'Callable[[str], object]') -> None:
         '''
         Format the data for xml
+
+        :param write: function called with each xml formatted line, e.g. the write method of the xml file
         '''
 
+        indent = _indent(self.level - 1)
+
         if len(self.children) > 0:
             # add newline before if level 1
             if self.level == 1:
-                self.xmllist.append('\n')
+                write('\n')
             # create xml wrapper
-            if self.key in self.key_to_attr.keys():
-                self.xmllist.append('\t' * (self.level - 1)+ f'<{self.key} {self.key_to_attr[self.key]}=\"{self.value}\" >\n')
+            attr = _KEY_TO_ATTR.get(self.key)
+            if attr is not None:
+                write(f'{indent}<{self.key} {attr}=\"{self.value}\" >\n')
             else:
-                self.xmllist.append('\t' * (self.level - 1) + f'<{self.key}>\n')
+                write(f'{indent}<{self.key}>\n')
             
             # beginning of the file requires a general simulation parameters tag
             if self.is_root:
-                self.xmllist.extend(['\n', '<GeneralSimulationParameters>\n'])
+                write('\n<GeneralSimulationParameters>\n')
             
             # create child xml's
             adding_gen_sim_params = True # this bool is to decide when to end the general simulation parameters tag
@@ -220,28 +279,93 @@ class DataNode():
                         if len(child.children) > 0:
                             # we are at the end of the general simulation parameters list
                             if adding_gen_sim_params:
-                                self.xmllist.append('</GeneralSimulationParameters>\n')
+                                write('</GeneralSimulationParameters>\n')
                                 adding_gen_sim_params = False
                 
                    # recursive step for xml formatting
-                    child.format_for_xml()
-
-                    if type(child.xmllist) is list:
-                        # extend the list
-                        self.xmllist.extend(child.xmllist)
-                    else:
-                        # append to the list
-                        self.xmllist.append(child.xmllist)
+                    child.format_for_xml(write)
 
             # close xml wrapper
-            self.xmllist.append('\t' * (self.level - 1) + f'</{self.key}>\n')
+            write(f'{indent}</{self.key}>\n')
 
         else:
-            # no children so we have an inline xml tag and will use a string
-            self.xmllist = '\t' * (self.level - 1) + f'<{self.key}> {self.value} </{self.key}>\n'
+            # no children so we have an inline xml tag
+            write(f'{indent}<{self.key}> {self.value} </{self.key}>\n')
                     
 
+# command line usage, printed when the arguments are invalid
+_USAGE = """usage:
+python solver_inp_to_xml.py path/to/solver.inp path/to/svFSI.xml
+python solver_inp_to_xml.py --batch [--force] path/to/dir 'path/to/sweep_*/solver.inp'"""
+
+
+def _convert_one(inp_file, xml_file):
+    '''
+    Convert a single solver.inp file to an svFSI.xml file.
+
+    :param inp_file: path to the solver.inp file
+    :param xml_file: path to the output svFSI.xml file
+    :return: the error message if the conversion failed, None otherwise
+    '''
+
+    try:
+        converter = SolverInpConverter(inp_file, xml_file)
+        converter.parse_inp_file(inp_file)
+        converter.convert_to_xml()
+    except (OSError, ValueError) as e:
+        return str(e)
+
+    return None
+
+
+def _batch_inp_files(paths):
+    '''
+    Expand directories and glob patterns to a sorted list of inp files.
+
+    :param paths: list of directories, which are searched for *.inp files, or paths with glob patterns
+    :return: the sorted inp files and the paths which did not match any file
+    '''
+
+    inp_files = set()
+    unmatched = []
+    for path in paths:
+        pattern = os.path.join(path, '*.inp') if os.path.isdir(path) else path
+        matches = glob.glob(pattern)
+        if not matches:
+            unmatched.append(path)
+        inp_files.update(matches)
+
+    return sorted(inp_files), unmatched
+
+
+def _load_compiled_module():
+    '''
+    Load the module compiled with setup.py, None if it was not built or is older than this script.
+    '''
+
+    try:
+        compiled = importlib.import_module('solver_inp_to_xml')
+    except ImportError:
+        return None
+
+    compiled_file = compiled.__file__ or ''
+    if compiled_file.endswith('.py') or os.path.getmtime(compiled_file) < os.path.getmtime(__file__):
+        return None
+
+    return compiled
+
+
 ####### FOR TESTING AGAINST OTHER SVFSI.XML FILES #######
+def _normalize_xml_lines(lines):
+    '''
+    Normalize xml lines for comparison in a single pass, removing blank lines and whitespace and fixing bools.
+
+    :param lines: iterable of lines of an xml file
+    '''
+
+    return [line.replace(' ', '').replace('true', '1').replace('false', '0') for line in (s.strip() for s in lines) if line]
+
+
 def compare_conversion(xml_file_conv, xml_file_ref):
     '''
     Compare converted and reference xml files to see if they are similar.
@@ -250,28 +374,20 @@ def compare_conversion(xml_file_conv, xml_file_ref):
     :param xml_file_ref: path to reference xml file
     '''
 
-    # load in reference and converted xml files, ignorint blank lines
+    # load in reference and converted xml files, ignoring blank lines
     with open(xml_file_ref, 'r') as f:
-        xml_ref = [line.strip() for line in f.readlines() if line.strip()]
+        xml_ref = _normalize_xml_lines(f)
     with open(xml_file_conv, 'r') as f:
-        xml_conv = [line.strip() for line in f.readlines() if line.strip()]
-    
-    # remove whitespace from the lines
-    xml_conv = [line.replace(' ', '') for line in xml_conv]
-    xml_ref = [line.replace(' ', '') for line in xml_ref]
-
-    # fix bools in xml_ref for easier comparison
-    for idx, line in enumerate(xml_ref):
-        if 'true' in line:
-            xml_ref[idx] = line.replace('true', '1')
-        if 'false' in line:
-            xml_ref[idx] = line.replace('false', '0')
-
-    for idx, line in enumerate(xml_conv):
-        if line != xml_ref[idx]:
+        xml_conv = _normalize_xml_lines(f)
+
+    for idx, (line, line_ref) in enumerate(zip(xml_conv, xml_ref)):
+        if line != line_ref:
             print(f'Conversion failed at line {idx}')
             print(f'CONVERTED: {line}')
-            print(f'REFERENCE: {xml_ref[idx]}')
+            print(f'REFERENCE: {line_ref}')
+
+    if len(xml_conv) != len(xml_ref):
+        print(f'Conversion has {len(xml_conv)} lines, reference has {len(xml_ref)} lines')
 
     if xml_conv == xml_ref:
         print('Conversion successful')
@@ -286,21 +402,66 @@ def compare_conversion(xml_file_conv, xml_file_ref):
 
 if __name__ == '__main__':
 
-    inp_file = sys.argv[1]
-    xml_file = sys.argv[2]
+    # plain python by default, the compiled extension built with setup.py is only used on request
+    module = sys.modules[__name__]
+    if os.environ.get('SVFSI_INP_TO_XML_COMPILED'):
+        compiled = _load_compiled_module()
+        if compiled is None:
+            print('Compiled solver_inp_to_xml module not found or older than this script, using plain python')
+        else:
+            module = compiled
+
+    batch = len(sys.argv) > 1 and sys.argv[1] == '--batch'
+    force = batch and sys.argv[2:3] == ['--force']
+    paths = sys.argv[3 if force else 2:]
+    if (batch and not paths) or (not batch and len(sys.argv) != 3):
+        sys.exit(_USAGE)
+
+    if batch:
+        inp_files, unmatched = module._batch_inp_files(paths)
+        if unmatched:
+            sys.exit('No inp files found for: ' + ', '.join(unmatched))
+
+        jobs = []
+        for inp_file in inp_files:
+            xml_file = os.path.splitext(inp_file)[0] + '.xml'
+            if os.path.exists(xml_file) and not force:
+                # don't overwrite existing xml files, e.g. a reference svFSI.xml next to svFSI.inp
+                print(f'Skipping {inp_file}, {xml_file} already exists (use --force to overwrite)')
+            else:
+                jobs.append((inp_file, xml_file))
+
+        # conversions are independent, run them in parallel processes
+        with Pool() as pool:
+            errors = pool.starmap(module._convert_one, jobs)
+
+        failed = [(inp_file, error) for (inp_file, _), error in zip(jobs, errors) if error is not None]
+        print(f'Conversion complete! {len(jobs) - len(failed)} files converted')
+        for (inp_file, xml_file), error in zip(jobs, errors):
+            if error is None:
+                print(f'Output written to {xml_file}')
+
+        if failed:
+            for inp_file, error in failed:
+                print(f'Conversion failed for {inp_file}: {error}', file=sys.stderr)
+            sys.exit(f'{len(failed)} of {len(jobs)} conversions failed')
+
+    else:
+        inp_file = sys.argv[1]
+        xml_file = sys.argv[2]
 
-    # inp_file = 'Code/Scripts/svFSI.inp'
-    # xml_file = 'Code/Scripts/svFSI_converted.xml'
+        # inp_file = 'Code/Scripts/svFSI.inp'
+        # xml_file = 'Code/Scripts/svFSI_converted.xml'
 
-    converter = SolverInpConverter(inp_file, xml_file)
-    converter.parse_inp_file(inp_file)
-    converter.convert_to_xml()
+        error = module._convert_one(inp_file, xml_file)
+        if error is not None:
+            sys.exit(f'Conversion failed for {inp_file}: {error}')
 
-    # ref = 'tests/cases/fsi/pipe_3d/svFSI.xml'
+        # ref = 'tests/cases/fsi/pipe_3d/svFSI.xml'
 
-    # compare_conversion(xml_file, ref)
+        # compare_conversion(xml_file, ref)
 
-    print(f'Conversion complete! Output written to {xml_file}')
+        print(f'Conversion complete! Output written to {xml_file}')
     print('Please compare solver choice, preconditioner choice, booleans and parameters to svFSIplus documentation and a similar reference xml file to ensure correctness.')
     print('See script documentation for futher information')
 
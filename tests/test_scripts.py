@@ -0,0 +1,57 @@
+import importlib.util
+import os
+
+import pytest
+
+# location of the scripts folder
+this_file_dir = os.path.abspath(os.path.dirname(__file__))
+scripts_dir = os.path.join(this_file_dir, "..", "Code", "Scripts")
+
+# load the solver.inp to svFSI.xml conversion script as a module
+spec = importlib.util.spec_from_file_location(
+    "solver_inp_to_xml", os.path.join(scripts_dir, "solver_inp_to_xml.py")
+)
+solver_inp_to_xml = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(solver_inp_to_xml)
+
+
+def convert(inp_file, xml_file):
+    """
+    Convert a solver.inp file and return the resulting svFSI.xml file as a string
+    """
+    converter = solver_inp_to_xml.SolverInpConverter(str(inp_file), str(xml_file))
+    converter.parse_inp_file(str(inp_file))
+    converter.convert_to_xml()
+    with open(xml_file) as f:
+        return f.read()
+
+
+def test_solver_inp_to_xml(tmp_path):
+    xml = convert(os.path.join(scripts_dir, "svFSI.inp"), tmp_path / "svFSI.xml")
+    with open(os.path.join(scripts_dir, "svFSI_converted.xml")) as f:
+        assert xml == f.read()
+
+
+def test_solver_inp_to_xml_comments(tmp_path):
+    inp_file = tmp_path / "solver.inp"
+    inp_file.write_text("A: x {\n  Viscosity: Constant {Value: 0.04}\n} # end\nB: t\n")
+    xml = convert(inp_file, tmp_path / "svFSI.xml")
+    assert "\t<Viscosity model=\"Constant\" >\n\t\t<Value> 0.04 </Value>\n\t</Viscosity>\n" in xml
+    assert "<B> 1 </B>\n</svFSIFile>\n" in xml
+
+
+@pytest.mark.parametrize(
+    "inp",
+    [
+        "A: x {\n  k: v\n}\n}\n",  # unmatched closing brace
+        "A: x {\n  k: v\n",  # nested data not closed
+        "Add mesh: m { # c\n  k: v\n}\n",  # brace line with trailing text
+        "A: {\n}\n",  # brace line without value
+        "K v\n",  # missing separator
+    ],
+)
+def test_solver_inp_to_xml_malformed(tmp_path, inp):
+    inp_file = tmp_path / "solver.inp"
+    inp_file.write_text(inp)
+    with pytest.raises(ValueError):
+        convert(inp_file, tmp_path / "svFSI.xml")